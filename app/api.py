@@ -1,6 +1,22 @@
-from fastapi import FastAPI, Query
+import json
+import logging
+import time
+import asyncio
+from contextlib import ExitStack
+from functools import partial
+from typing import Optional
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import iterate_in_threadpool
 from pydantic import BaseModel
-from app.query import vector_search, hybrid_search
+from app.query import vector_search, hybrid_search, search_params, SEARCH_PRESETS, DEFAULT_PRESET
+from app.context import build_context, DEFAULT_MAX_TOKENS
+from app.generate import get_generator
+from app.tenants import registry, validate_tenant, UnknownTenant, TenantBusy
+from app import ingest as ingest_pdfs
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="PDF RAG System", description="A professional RAG system for intelligent document processing and semantic search")
 
@@ -23,21 +39,57 @@ def root():
         "description": "Professional document processing and semantic search platform",
         "endpoints": {
             "/search": "Search documents with semantic similarity",
-            "/ask": "Ask questions and get answers with citations"
+            "/ask": "Ask questions and get answers with citations",
+            "/ask/stream": "Stream the answer as Server-Sent Events (citations first, then tokens)",
+            "/presets": "List approximate-search presets",
+            "/ingest": "Ingest a tenant's PDFs (POST)",
+            "/tenants": "Loaded tenant indexes and memory use"
         },
+        "tenants": "Select a tenant with the X-Tenant header or ?tenant= parameter",
         "docs": "/docs"
     }
 
+@app.exception_handler(UnknownTenant)
+def unknown_tenant(request: Request, exc: UnknownTenant):
+    return JSONResponse(status_code=404, content={"detail": str(exc)})
+
+@app.exception_handler(TenantBusy)
+def tenant_busy(request: Request, exc: TenantBusy):
+    return JSONResponse(status_code=429, content={"detail": str(exc)})
+
+def _tenant(x_tenant: Optional[str] = Header(None, description="Tenant namespace"), tenant: Optional[str] = Query(None, description="Tenant namespace (overrides the X-Tenant header)")) -> str:
+    """Resolve the request's tenant from the query parameter or X-Tenant header."""
+    try:
+        return validate_tenant(tenant or x_tenant)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _search_params(k: int, preset: Optional[str], ef: Optional[int], candidates: Optional[int]):
+    """Resolve search tuning parameters, rejecting unknown presets."""
+    try:
+        return search_params(k, preset, ef, candidates)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/presets")
+def presets():
+    """List the approximate-search presets accepted by /search and /ask."""
+    return {"default": DEFAULT_PRESET, "presets": SEARCH_PRESETS}
+
 @app.get("/search", response_model=list[SearchHit])
-def search(q: str = Query(..., description="Search query"), k: int = Query(5, description="Number of results"), hybrid: bool = Query(True, description="Use hybrid search (vector + BM25)")):
+def search(q: str = Query(..., description="Search query"), k: int = Query(5, description="Number of results"), hybrid: bool = Query(True, description="Use hybrid search (vector + BM25)"), preset: Optional[str] = Query(None, description=f"Search preset: {', '.join(SEARCH_PRESETS)} (default: {DEFAULT_PRESET})"), ef: Optional[int] = Query(None, ge=1, description="HNSW search beam width (overrides preset)"), candidates: Optional[int] = Query(None, ge=1, description="Vector candidate pool size (overrides preset)"), tenant: str = Depends(_tenant)):
     """
     Search documents using semantic similarity.
     
     - **q**: Your search query
     - **k**: Number of results to return (default: 5)
     - **hybrid**: Whether to use hybrid search combining vector similarity and BM25 (default: True)
+    - **preset**: Recall/latency trade-off: fast, balanced or accurate (see `/presets`)
+    - **ef** / **candidates**: Fine-grained overrides for the HNSW beam width and candidate pool
     """
-    hits = hybrid_search(q, k=k) if hybrid else vector_search(q, k=k)
+    ef, candidates = _search_params(k, preset, ef, candidates)
+    with registry.slot(tenant, "query"):
+        hits = hybrid_search(q, k=k, ef=ef, candidates=candidates, tenant=tenant) if hybrid else vector_search(q, k=k, ef=ef, tenant=tenant)
     return [
         SearchHit(
             id=h["id"], 
@@ -49,42 +101,156 @@ def search(q: str = Query(..., description="Search query"), k: int = Query(5, de
     for h in hits]
 
 @app.get("/ask", response_model=AskResponse)
-def ask(q: str = Query(..., description="Your question"), k: int = Query(5, description="Number of context chunks to use")):
+def ask(q: str = Query(..., description="Your question"), k: int = Query(5, description="Number of context chunks to use"), max_tokens: int = Query(DEFAULT_MAX_TOKENS, ge=1, description="Token budget for the assembled context"), preset: Optional[str] = Query(None, description=f"Search preset: {', '.join(SEARCH_PRESETS)} (default: {DEFAULT_PRESET})"), ef: Optional[int] = Query(None, ge=1, description="HNSW search beam width (overrides preset)"), candidates: Optional[int] = Query(None, ge=1, description="Vector candidate pool size (overrides preset)"), tenant: str = Depends(_tenant)):
     """
     Ask a question and get an answer with citations.
     
     - **q**: Your question
     - **k**: Number of context chunks to use for answering (default: 5)
+    - **max_tokens**: Token budget for the context, spent on chunks in score order; kept chunks from the same page are then merged
+    - **preset** / **ef** / **candidates**: Search tuning, as for `/search`
     """
-    hits = hybrid_search(q, k=k)
-    
-    if not hits:
+    ef, candidates = _search_params(k, preset, ef, candidates)
+    # the quota covers generation too; with a real LLM that's the expensive part
+    with registry.slot(tenant, "query"):
+        hits = hybrid_search(q, k=k, ef=ef, candidates=candidates, tenant=tenant)
+        
+        if not hits:
+            return AskResponse(
+                answer="No relevant documents found to answer your question.",
+                citations=[]
+            )
+        
+        ctx = build_context(hits, max_tokens=max_tokens)
+        
         return AskResponse(
-            answer="No relevant documents found to answer your question.",
-            citations=[]
+            answer=get_generator().generate(q, ctx["text"]),
+            citations=ctx["citations"]
         )
-    
-    context = "\n\n".join([
-        f"[{i+1}] ({h['meta']['source']} p.{h['meta']['page']}) {h['text']}" 
-        for i, h in enumerate(hits)
-    ])
-    
-    answer = f"""Based on the available documents, here's what I found:
 
-Question: {q}
+def _release_slot(slot: ExitStack, retrieval: asyncio.Future):
+    """Give back a stream's query slot, waiting for retrieval if it's still running."""
+    if retrieval.done():
+        slot.close()
+    else:
+        retrieval.add_done_callback(lambda _: slot.close())
+
+def _sse(event: str, data) -> str:
+    """Format a single Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-Relevant Context:
-{context}
+def _metrics(t0: float, ttfb: float, retrieval_done: float, first_token: Optional[float], n_tokens: int, gen_time: Optional[float]) -> dict:
+    """Payload of the final `done` event; the same keys on every path."""
+    return {
+        "ttfb_ms": ttfb * 1000,
+        "retrieval_ms": (retrieval_done - t0) * 1000,
+        "time_to_first_token_ms": (first_token - t0) * 1000 if first_token else None,
+        "tokens": n_tokens,
+        "tokens_per_s": n_tokens / gen_time if gen_time else None,
+    }
 
-Note: This is a demonstration system. In a production environment, this would be connected to an LLM for generating more sophisticated answers.
+def _error_event(e: Exception) -> str:
+    """SSE `error` event for a failure after the stream has started (headers already sent)."""
+    status = 404 if isinstance(e, UnknownTenant) else 429 if isinstance(e, TenantBusy) else 500
+    if status == 500:
+        logger.exception("/ask/stream failed after the response started", exc_info=e)
+    return _sse("error", {"status": status, "detail": str(e) if status != 500 else "Internal server error"})
+
+async def _stream_answer(q: str, retrieval: asyncio.Future, slot: ExitStack, max_tokens: int, t0: float):
+    """
+    Yield the SSE stream for /ask/stream: citations, then tokens, then metrics.
+    
+    ``ttfb_ms`` in the final metrics is the time until the initial ``: retrieving``
+    comment is yielded (i.e. when headers go out); it doesn't wait for retrieval.
+    ``time_to_first_token_ms`` is the time until the first generated token.
+    """
+    # the tenant's query slot is held until generation finishes
+    try:
+        # Flush headers and a first byte right away; retrieval is already running
+        yield ": retrieving\n\n"
+        ttfb = time.perf_counter() - t0
+    
+        try:
+            hits = await retrieval
+        except Exception as e:
+            yield _error_event(e)
+            return
+        retrieval_done = time.perf_counter()
+    
+        if not hits:
+            yield _sse("citations", [])
+            first_token = time.perf_counter()
+            yield _sse("token", "No relevant documents found to answer your question.")
+            yield _sse("done", _metrics(t0, ttfb, retrieval_done, first_token, 1, None))
+            return
+    
+        ctx = build_context(hits, max_tokens=max_tokens)
+        yield _sse("citations", ctx["citations"])
+    
+        n_tokens, first_token = 0, None
+        gen_start = time.perf_counter()
+        try:
+            # generators are plain (blocking) iterators; keep them off the event loop
+            async for token in iterate_in_threadpool(get_generator().stream(q, ctx["text"])):
+                if first_token is None:
+                    first_token = time.perf_counter()
+                n_tokens += 1
+                yield _sse("token", token)
+        except Exception as e:
+            yield _error_event(e)
+            return
+        gen_time = time.perf_counter() - gen_start
+    
+        yield _sse("done", _metrics(t0, ttfb, retrieval_done, first_token, n_tokens, gen_time))
+    finally:
+        _release_slot(slot, retrieval)
 
-Citations: {[(h['meta']['source'], h['meta']['page']) for h in hits]}"""
+@app.get("/ask/stream")
+async def ask_stream(q: str = Query(..., description="Your question"), k: int = Query(5, description="Number of context chunks to use"), max_tokens: int = Query(DEFAULT_MAX_TOKENS, ge=1, description="Token budget for the assembled context"), preset: Optional[str] = Query(None, description=f"Search preset: {', '.join(SEARCH_PRESETS)} (default: {DEFAULT_PRESET})"), ef: Optional[int] = Query(None, ge=1, description="HNSW search beam width (overrides preset)"), candidates: Optional[int] = Query(None, ge=1, description="Vector candidate pool size (overrides preset)"), tenant: str = Depends(_tenant)):
+    """
+    Ask a question and stream the answer as Server-Sent Events.
     
-    return AskResponse(
-        answer=answer,
-        citations=[{"source": h["meta"]["source"], "page": h["meta"]["page"]} for h in hits]
+    Events are sent in order: `citations` (JSON list), one `token` per generated
+    piece of text, and a final `done` event with latency and throughput metrics.
+    Retrieval starts before the response is opened so it overlaps with connection setup.
+    An unknown tenant gets HTTP 404 and an over-quota tenant HTTP 429 up front; any failure after that point
+    (search or generation errors) arrives as an `error` event with an HTTP-style `status` instead of `done`.
+    The tenant's query slot is held until the stream ends.
+    """
+    t0 = time.perf_counter()
+    ef, candidates = _search_params(k, preset, ef, candidates)
+    # take the quota slot here (never blocks) so unknown/over-quota tenants get a plain 404/429
+    slot = ExitStack()
+    slot.enter_context(registry.slot(tenant, "query"))
+    retrieval = asyncio.get_running_loop().run_in_executor(None, partial(hybrid_search, q, k=k, ef=ef, candidates=candidates, tenant=tenant))
+    return StreamingResponse(
+        _stream_answer(q, retrieval, slot, max_tokens, t0),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+        # safety net if the client disconnects before the stream starts
+        background=BackgroundTask(_release_slot, slot, retrieval),
     )
 
+@app.post("/ingest")
+def ingest(tenant: str = Depends(_tenant)):
+    """
+    Ingest the tenant's PDFs (data/ for the default tenant, data/<tenant>/ otherwise).
+    
+    Only one ingestion per tenant runs at a time; the tenant's indexes are reloaded on the next query.
+    """
+    return {"tenant": tenant, **ingest_pdfs.main(tenant=tenant)}
+
+@app.get("/tenants")
+def tenants():
+    """Tenant indexes currently loaded in memory, least recently used first."""
+    return {
+        "loaded": registry.loaded(),
+        "vector_bytes": registry.vector_used(),
+        "vector_budget_bytes": registry.vector_budget,
+        "lexical_bytes": registry.lexical_used(),
+        "lexical_budget_bytes": registry.lexical_budget,
+    }
+
 @app.get("/health")
 def health():
     """Health check endpoint."""
@@ -0,0 +1,98 @@
+import time
+from typing import List
+import numpy as np
+from app.query import SEARCH_PRESETS, search_params, vector_search, hybrid_search, rerank, _model
+from app.tenants import registry, validate_tenant, DEFAULT_TENANT
+from app.eval import TESTS
+
+def exact_search(corpus: np.ndarray, q_emb: np.ndarray, k: int) -> np.ndarray:
+    """Brute-force cosine search; returns row indices of the top-k vectors."""
+    sims = corpus @ q_emb
+    top = np.argpartition(-sims, min(k, len(sims)) - 1)[:k]
+    return top[np.argsort(-sims[top])]
+
+def run(k=10, n_queries=50, repeats=3, tenant=DEFAULT_TENANT):
+    """
+    Chart recall against exact search versus latency for each search preset.
+
+    Each preset runs through the real search path (vector_search and
+    hybrid_search with the preset's ef and candidate pool). Vector recall@k
+    compares against brute-force top-k; hybrid recall@k compares against the
+    same BM25 rerank applied to the brute-force top candidates. Queries are
+    the evaluation questions plus a sample of stored chunks, so the benchmark
+    always runs on our own corpus.
+    """
+    tenant = validate_tenant(tenant)
+    col = registry.get(tenant).collection
+    data = col.get(include=["embeddings", "documents", "metadatas"])
+    ids = data["ids"]
+    if not ids:
+        print("Collection is empty, run python app/ingest.py first.")
+        return {}
+
+    corpus = np.asarray(data["embeddings"], dtype=np.float32)
+    corpus /= np.linalg.norm(corpus, axis=1, keepdims=True) + 1e-12
+
+    rng = np.random.default_rng(0)
+    sample = rng.choice(len(ids), size=min(n_queries, len(ids)), replace=False)
+    queries: List[str] = [t["q"] for t in TESTS] + [" ".join(data["documents"][i].split()[:32]) for i in sample]
+
+    def exact_vector(query: str, n: int):
+        q_emb = _model().encode([query], convert_to_numpy=True)[0].astype(np.float32)
+        q_emb /= np.linalg.norm(q_emb) + 1e-12
+        rows = exact_search(corpus, q_emb, n)
+        return [{"id": ids[i], "text": data["documents"][i], "meta": data["metadatas"][i],
+                 "score": float(corpus[i] @ q_emb)} for i in rows]
+
+    k = min(k, len(ids))
+    print(f"Benchmarking {len(queries)} queries over {len(ids)} chunks (recall@{k}, {repeats} repeats)...")
+    print("-" * 88)
+
+    results = {}
+    latencies = []
+    for _ in range(repeats):
+        for q in queries:
+            t = time.perf_counter()
+            exact_vector(q, k)
+            latencies.append((time.perf_counter() - t) * 1000)
+    truth = {q: {h["id"] for h in exact_vector(q, k)} for q in queries}
+    results["exact"] = {"vector_recall": 1.0, "hybrid_recall": 1.0,
+                        "mean_ms": float(np.mean(latencies)), "p95_ms": float(np.percentile(latencies, 95))}
+
+    for name in SEARCH_PRESETS:
+        ef, candidates = search_params(k, preset=name)
+        v_hit = h_hit = 0
+        for q in queries:
+            v_hit += len(truth[q] & {h["id"] for h in vector_search(q, k=k, ef=ef, tenant=tenant)})
+            exact_hybrid = {h["id"] for h in rerank(q, exact_vector(q, min(candidates, len(ids))), k=k, tenant=tenant)}
+            h_hit += len(exact_hybrid & {h["id"] for h in hybrid_search(q, k=k, ef=ef, candidates=candidates, tenant=tenant)})
+        latencies = []
+        for _ in range(repeats):
+            for q in queries:
+                t = time.perf_counter()
+                hybrid_search(q, k=k, ef=ef, candidates=candidates, tenant=tenant)
+                latencies.append((time.perf_counter() - t) * 1000)
+        results[name] = {
+            "vector_recall": v_hit / (k * len(queries)),
+            "hybrid_recall": h_hit / (k * len(queries)),
+            "mean_ms": float(np.mean(latencies)),
+            "p95_ms": float(np.percentile(latencies, 95)),
+            "ef": ef,
+            "candidates": candidates,
+        }
+
+    slowest = max(r["mean_ms"] for r in results.values()) or 1.0
+    for name, r in results.items():
+        bar = "█" * max(1, int(30 * r["mean_ms"] / slowest))
+        print(f"{name:>9}  vector {r['vector_recall']:7.2%}  hybrid {r['hybrid_recall']:7.2%}  "
+              f"mean {r['mean_ms']:7.2f} ms  p95 {r['p95_ms']:7.2f} ms  {bar}")
+    print("-" * 88)
+    print("latency: hybrid_search end to end (query embedding, HNSW search, document fetch, BM25 rerank)")
+    print("exact = query embedding + brute-force cosine over all stored embeddings (in-process numpy)")
+
+    return results
+
+if __name__ == "__main__":
+    import sys
+
+    run(k=int(sys.argv[1]) if len(sys.argv) > 1 else 10, tenant=sys.argv[2] if len(sys.argv) > 2 else DEFAULT_TENANT)
@@ -0,0 +1,142 @@
+import re
+from typing import List, Dict, Optional, Tuple
+
+# Whitespace tokens, same unit chunk_text uses for chunk_size/chunk_overlap
+DEFAULT_MAX_TOKENS = 1000
+
+def _score(hit: dict) -> float:
+    """Score used to rank a hit (hybrid score when available)."""
+    return hit.get("hybrid", hit["score"])
+
+def _segment(hit: dict) -> dict:
+    """Turn a search hit into a mergeable context segment."""
+    meta = hit["meta"]
+    return {
+        "source": meta["source"],
+        "page": meta["page"],
+        "start": meta.get("char_start"),
+        "end": meta.get("char_end"),
+        "text": hit["text"],
+        "score": _score(hit),
+    }
+
+def _merge(segments: List[dict]) -> List[dict]:
+    """
+    Merge overlapping or adjacent segments that come from the same page.
+
+    Segments without character spans (indexes built before spans were
+    recorded) can't be placed on the page, so they are only de-duplicated.
+    """
+    merged, seen_texts = [], set()
+    by_page: Dict[tuple, List[dict]] = {}
+    for s in segments:
+        if s["start"] is None or s["end"] is None:
+            if s["text"] not in seen_texts:
+                seen_texts.add(s["text"])
+                merged.append(s)
+            continue
+        by_page.setdefault((s["source"], s["page"]), []).append(s)
+
+    for group in by_page.values():
+        group.sort(key=lambda s: s["start"])
+        cur = dict(group[0])
+        for s in group[1:]:
+            if s["start"] <= cur["end"]:
+                # overlapping: append only the part of s past the current end
+                if s["end"] > cur["end"]:
+                    cur["text"] += s["text"][cur["end"] - s["start"]:]
+                    cur["end"] = s["end"]
+            elif s["start"] == cur["end"] + 1:
+                # adjacent: chunks are separated by a single space
+                cur["text"] += " " + s["text"]
+                cur["end"] = s["end"]
+            else:
+                merged.append(cur)
+                cur = dict(s)
+                continue
+            cur["score"] = max(cur["score"], s["score"])
+        merged.append(cur)
+    return merged
+
+def _trim(segment: dict, n_tokens: int) -> dict:
+    """Cut a segment down to its first n_tokens tokens, keeping its span accurate."""
+    text = " ".join(segment["text"].split()[:n_tokens])
+    trimmed = dict(segment, text=text)
+    if segment["start"] is not None:
+        trimmed["end"] = segment["start"] + len(text)
+    return trimmed
+
+def _select(segments: List[dict], max_tokens: Optional[int]) -> Tuple[List[dict], int]:
+    """
+    Spend the token budget on segments in score order.
+
+    Only tokens not already covered by a better-scoring segment from the same
+    page count against the budget; the last segment is trimmed to fit.
+    """
+    selected, used, seen_texts = [], 0, set()
+    covered: Dict[tuple, List[Tuple[int, int]]] = {}
+    for s in sorted(segments, key=lambda s: s["score"], reverse=True):
+        remaining = None if max_tokens is None else max_tokens - used
+        if remaining is not None and remaining <= 0:
+            break
+        if s["start"] is None or s["end"] is None:
+            if s["text"] in seen_texts:
+                continue
+            seen_texts.add(s["text"])
+            n = len(s["text"].split())
+            if remaining is not None and n > remaining:
+                s, n = _trim(s, remaining), remaining
+            selected.append(s)
+            used += n
+            continue
+
+        spans = covered.setdefault((s["source"], s["page"]), [])
+        new, cut = 0, None
+        for m in re.finditer(r"\S+", s["text"]):
+            pos = s["start"] + m.start()
+            if any(lo <= pos < hi for lo, hi in spans):
+                continue
+            if remaining is not None and new == remaining:
+                cut = m.start()
+                break
+            new += 1
+        if not new:
+            continue
+        if cut is not None:
+            text = s["text"][:cut].rstrip()
+            s = dict(s, text=text, end=s["start"] + len(text))
+        spans.append((s["start"], s["end"]))
+        selected.append(s)
+        used += new
+    return selected, used
+
+def cite(segment: dict) -> str:
+    """Compact citation label, e.g. ``manual.pdf p.3 [120:4821]``."""
+    label = f"{segment['source']} p.{segment['page']}"
+    if segment.get("start") is not None:
+        label += f" [{segment['start']}:{segment['end']}]"
+    return label
+
+def build_context(hits: List[dict], max_tokens: Optional[int] = DEFAULT_MAX_TOKENS) -> Dict:
+    """
+    Assemble LLM context from search hits.
+
+    The ``max_tokens`` whitespace-token budget (no limit when None) is spent
+    on hits in score order, so lower-scoring chunks never crowd out better
+    ones. The kept spans are then merged where they overlap or touch on the
+    same source and page, and ordered by score.
+
+    Returns:
+        Dict with the assembled ``text``, its ``tokens`` count and a list of
+        ``citations`` pointing at character spans of the source pages
+    """
+    selected, used = _select([_segment(h) for h in hits], max_tokens)
+    selected = _merge(selected)
+    selected.sort(key=lambda s: s["score"], reverse=True)
+
+    text = "\n\n".join(f"[{i+1}] ({cite(s)}) {s['text']}" for i, s in enumerate(selected))
+    citations = [
+        {"ref": i + 1, "source": s["source"], "page": s["page"], "start": s["start"], "end": s["end"], "score": s["score"]}
+        for i, s in enumerate(selected)
+    ]
+    return {"text": text, "tokens": used, "citations": citations}
@@ -0,0 +1,62 @@
+import re
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterator, Optional
+
+DEFAULT_GENERATOR = "template"
+
+class Generator(ABC):
+    """
+    Answer generation backend for /ask.
+
+    Subclasses implement ``stream`` and yield text pieces as they are
+    produced; concatenating them gives the full answer.
+    """
+
+    @abstractmethod
+    def stream(self, question: str, context: str) -> Iterator[str]:
+        """Yield the answer to ``question`` piece by piece, grounded in ``context``."""
+
+    def generate(self, question: str, context: str) -> str:
+        """Generate the full answer in one go."""
+        return "".join(self.stream(question, context))
+
+class TemplateGenerator(Generator):
+    """
+    Deterministic local stand-in for an LLM.
+
+    Emits the demonstration answer one whitespace token at a time, with an
+    optional per-token delay to simulate model latency.
+    """
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+
+    def stream(self, question: str, context: str) -> Iterator[str]:
+        answer = f"""Based on the available documents, here's what I found:
+
+Question: {question}
+
+Relevant Context:
+{context}
+
+Note: This is a demonstration system. In a production environment, this would be connected to an LLM for generating more sophisticated answers."""
+        for token in re.findall(r"\S+\s*", answer):
+            if self.delay:
+                time.sleep(self.delay)
+            yield token
+
+GENERATORS: Dict[str, Callable[[], Generator]] = {
+    "template": TemplateGenerator,
+}
+
+def register_generator(name: str, factory: Callable[[], Generator]):
+    """Make a generator backend available under ``name``."""
+    GENERATORS[name] = factory
+
+def get_generator(name: Optional[str] = None) -> Generator:
+    """Instantiate the generator backend registered under ``name`` (default: DEFAULT_GENERATOR)."""
+    name = name or DEFAULT_GENERATOR
+    if name not in GENERATORS:
+        raise ValueError(f"Unknown generator '{name}'. Available: {sorted(GENERATORS)}")
+    return GENERATORS[name]()
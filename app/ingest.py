@@ -1,28 +1,54 @@
 import os
 import glob
-import chromadb
 from sentence_transformers import SentenceTransformer
-from app.utils import load_pdf, chunk_text
+from app.utils import load_pdf, chunk_text_with_spans
+from app.tenants import registry, collection_name, data_dir as tenant_data_dir, get_client, validate_tenant, DEFAULT_TENANT
 
-DB_DIR = "store"
-COLLECTION = "docs"
-
-def get_client():
-    """Get ChromaDB client with persistent storage."""
-    return chromadb.PersistentClient(path=DB_DIR)
-
-def main(data_dir="data"):
-    """Main ingestion function that processes PDFs and stores them in the vector database."""
-    client = get_client()
-    col = client.get_or_create_collection(COLLECTION, metadata={"hnsw:space":"cosine"})
-    model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+# HNSW build parameters; search-time ef is chosen per request (see app.query)
+HNSW_M = 16
+HNSW_CONSTRUCTION_EF = 200
+HNSW_SEARCH_EF = 10
 
+def main(data_dir=None, tenant=DEFAULT_TENANT):
+    """
+    Main ingestion function that processes PDFs and stores them in the vector database.
+    
+    Args:
+        data_dir: Directory of PDFs (defaults to data/ for the default tenant, data/<tenant>/ otherwise)
+        tenant: Tenant namespace whose collection receives the chunks
+    
+    Returns:
+        Dict with the number of files and chunks ingested
+    """
+    tenant = validate_tenant(tenant)
+    data_dir = data_dir or tenant_data_dir(tenant)
+    
+    # check before touching the store so a bare tenant name doesn't create an empty collection
     pdfs = glob.glob(os.path.join(data_dir, "*.pdf"))
     if not pdfs:
         print(f"No PDF files found in {data_dir}/")
-        print("Please add some PDF files to the data/ directory and run again.")
-        return
+        print(f"Please add some PDF files to the {data_dir}/ directory and run again.")
+        return {"files": 0, "chunks": 0}
     
+    with registry.slot(tenant, "ingest"):
+        client = get_client(tenant)
+        try:
+            result = _ingest(client, pdfs, tenant)
+        finally:
+            client.close()
+    registry.invalidate(tenant)
+    return result
+
+def _ingest(client, pdfs, tenant):
+    """Ingest the given PDFs into the tenant's collection."""
+    col = client.get_or_create_collection(collection_name(tenant), metadata={
+        "hnsw:space": "cosine",
+        "hnsw:M": HNSW_M,
+        "hnsw:construction_ef": HNSW_CONSTRUCTION_EF,
+        "hnsw:search_ef": HNSW_SEARCH_EF,
+    })
+    model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+
     id_counter = 0
     total_chunks = 0
     
@@ -30,11 +56,16 @@ def main(data_dir="data"):
         print(f"Processing: {os.path.basename(path)}")
         pages = load_pdf(path)
         for p in pages:
-            chunks = chunk_text(p["text"])
+            spans = chunk_text_with_spans(p["text"])
+            chunks = [c["text"] for c in spans]
             if chunks:  # Only process if we have chunks
                 embeddings = model.encode(chunks, convert_to_numpy=True).tolist()
                 ids = [f"{os.path.basename(path)}::p{p['page']}::c{id_counter+i}" for i in range(len(chunks))]
-                metadatas = [{"source": os.path.basename(path), "page": p["page"], "chunk_index": i} for i in range(len(chunks))]
+                metadatas = [
+                    {"source": os.path.basename(path), "page": p["page"], "chunk_index": i,
+                     "char_start": c["start"], "char_end": c["end"]}
+                    for i, c in enumerate(spans)
+                ]
                 col.add(documents=chunks, embeddings=embeddings, metadatas=metadatas, ids=ids)
                 id_counter += len(chunks)
                 total_chunks += len(chunks)
@@ -42,6 +73,9 @@ def main(data_dir="data"):
 
     print(f"\n✅ Ingested {len(pdfs)} file(s) with {total_chunks} total chunks.")
     print(f"Collection count: {col.count()}")
+    return {"files": len(pdfs), "chunks": total_chunks}
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    import sys
+    
+    main(tenant=sys.argv[1] if len(sys.argv) > 1 else DEFAULT_TENANT) 
\ No newline at end of file
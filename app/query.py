@@ -1,33 +1,70 @@
-from typing import List, Tuple
-import chromadb
+from functools import lru_cache
+from typing import List, Optional, Tuple
 from sentence_transformers import SentenceTransformer
 from rank_bm25 import BM25Okapi
+from app.tenants import registry, DEFAULT_TENANT
 
-DB_DIR = "store"
-COLLECTION = "docs"
+# Approximate-search presets. Chroma's HNSW ef is fixed per collection, but
+# hnswlib searches with max(ef, n_results), so asking for `ef` results and
+# keeping the best ones gives the same beam width per request.
+SEARCH_PRESETS = {
+    "fast": {"ef": 10, "candidates": 10},
+    "balanced": {"ef": 50, "candidates": 30},
+    "accurate": {"ef": 200, "candidates": 100},
+}
+DEFAULT_PRESET = "fast"
 
-def _client():
-    """Get ChromaDB client with persistent storage."""
-    return chromadb.PersistentClient(path=DB_DIR)
+def search_params(k=5, preset: Optional[str] = None, ef: Optional[int] = None, candidates: Optional[int] = None) -> Tuple[int, int]:
+    """
+    Resolve the (ef, candidates) pair for a search.
+
+    Explicit ``ef``/``candidates`` override the preset. The candidate pool is
+    never smaller than ``k`` and ef never smaller than the pool.
+    """
+    preset = preset or DEFAULT_PRESET
+    if preset not in SEARCH_PRESETS:
+        raise ValueError(f"Unknown search preset '{preset}'. Available: {sorted(SEARCH_PRESETS)}")
+    params = SEARCH_PRESETS[preset]
+    candidates = max(candidates or params["candidates"], k)
+    ef = max(ef or params["ef"], candidates)
+    return ef, candidates
 
-def vector_search(query: str, k=5) -> List[dict]:
-    """Perform vector similarity search using sentence transformers."""
-    client = _client()
-    col = client.get_collection(COLLECTION)
-    model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
-    q_emb = model.encode([query], convert_to_numpy=True).tolist()
-    res = col.query(query_embeddings=q_emb, n_results=k, include=["documents","metadatas","distances"])
+@lru_cache(maxsize=1)
+def _model() -> SentenceTransformer:
+    """Embedding model, loaded once per process."""
+    return SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+
+def vector_search(query: str, k=5, ef: Optional[int] = None, tenant: str = DEFAULT_TENANT) -> List[dict]:
+    """
+    Perform vector similarity search using sentence transformers.
+    
+    Args:
+        query: Search query
+        k: Number of results to return
+        ef: HNSW search beam width (defaults to k)
+        tenant: Tenant whose collection is searched
+    """
+    col = registry.get(tenant).collection
+    q_emb = _model().encode([query], convert_to_numpy=True).tolist()
+    # widen the beam with ids/distances only, then fetch documents for the hits we keep
+    res = col.query(query_embeddings=q_emb, n_results=max(k, ef or 0), include=["distances"])
+    ids, distances = res["ids"][0][:k], res["distances"][0][:k]
+    if not ids:
+        return []
+    docs = col.get(ids=ids, include=["documents","metadatas"])
+    by_id = {id_: (doc, meta) for id_, doc, meta in zip(docs["ids"], docs["documents"], docs["metadatas"])}
     hits = []
-    for i in range(len(res["documents"][0])):
+    for id_, dist in zip(ids, distances):
+        doc, meta = by_id[id_]
         hits.append({
-            "id": f"result_{i}",  # Generate a simple ID since we can't get the original IDs
-            "text": res["documents"][0][i],
-            "meta": res["metadatas"][0][i],
-            "score": 1 - res["distances"][0][i]  # cosine → similarity
+            "id": id_,
+            "text": doc,
+            "meta": meta,
+            "score": 1 - dist  # cosine → similarity
         })
     return hits
 
-def hybrid_search(query: str, k=5, alpha=0.5) -> List[dict]:
+def hybrid_search(query: str, k=5, alpha=0.5, preset: Optional[str] = None, ef: Optional[int] = None, candidates: Optional[int] = None, tenant: str = DEFAULT_TENANT) -> List[dict]:
     """
     Hybrid search combining vector similarity and BM25.
     
@@ -35,17 +72,29 @@ def hybrid_search(query: str, k=5, alpha=0.5) -> List[dict]:
         query: Search query
         k: Number of results to return
         alpha: Weight for vector score; (1-alpha) for BM25 score
+        preset: Named search preset (see SEARCH_PRESETS)
+        ef: HNSW search beam width, overrides the preset
+        candidates: Number of vector candidates to rerank, overrides the preset
+        tenant: Tenant whose collection and lexical index are searched
     
     Returns:
         List of search hits with hybrid scores
     """
-    v_hits = vector_search(query, k=10)
+    ef, candidates = search_params(k, preset, ef, candidates)
+    v_hits = vector_search(query, k=candidates, ef=ef, tenant=tenant)
+    return rerank(query, v_hits, k=k, alpha=alpha, tenant=tenant)
+
+def rerank(query: str, v_hits: List[dict], k=5, alpha=0.5, tenant: str = DEFAULT_TENANT) -> List[dict]:
+    """Blend vector scores of candidate hits with BM25 and keep the top k."""
+    if not v_hits:
+        return []
 
-    # BM25 over candidate texts for simplicity (corpus limited to v_hits)
-    texts = [h["text"] for h in v_hits]
-    tokenized = [t.split() for t in texts]
-    bm25 = BM25Okapi(tokenized)
-    bm_scores = bm25.get_scores(query.split())
+    # BM25 from the tenant's corpus-wide lexical index
+    bm_scores = registry.get(tenant).bm25_scores(query, [h["id"] for h in v_hits])
+    if bm_scores is None:
+        # index is stale (ingested by another process); score over the candidates only
+        bm25 = BM25Okapi([h["text"].split() for h in v_hits])
+        bm_scores = bm25.get_scores(query.split())
     
     # normalize both scores
     v_max = max(h["score"] for h in v_hits) or 1.0
@@ -55,4 +104,4 @@ def hybrid_search(query: str, k=5, alpha=0.5) -> List[dict]:
         h["hybrid"] = alpha * (h["score"]/v_max) + (1-alpha) * (b/b_max)
 
     v_hits.sort(key=lambda x: x["hybrid"], reverse=True)
-    return v_hits[:k] 
\ No newline at end of file
+    return v_hits[:k]
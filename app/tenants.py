@@ -0,0 +1,220 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Optional
+import chromadb
+from chromadb.errors import NotFoundError
+from rank_bm25 import BM25Okapi
+
+DB_DIR = "store"
+DATA_DIR = "data"
+COLLECTION = "docs"
+DEFAULT_TENANT = "default"
+
+# Memory budgets for loaded tenant indexes. Past either one, idle tenants are
+# evicted least recently used first and their Chroma client is closed, which
+# releases that tenant's HNSW index.
+VECTOR_MEMORY_BUDGET_MB = 1024
+LEXICAL_MEMORY_BUDGET_MB = 256
+
+# Per-tenant concurrency quotas; requests over quota are rejected immediately
+TENANT_QUERY_CONCURRENCY = 4
+TENANT_INGEST_CONCURRENCY = 1
+
+_TENANT_RE = re.compile(r"^[a-z0-9](?:[a-z0-9_-]{0,38}[a-z0-9])?$")
+
+class UnknownTenant(Exception):
+    """Raised when a tenant has no collection yet (nothing ingested)."""
+
+class TenantBusy(Exception):
+    """Raised when a tenant is over its concurrency quota."""
+
+def validate_tenant(tenant: Optional[str]) -> str:
+    """Normalize a tenant name, falling back to the default tenant."""
+    tenant = (tenant or DEFAULT_TENANT).strip().lower()
+    if not _TENANT_RE.match(tenant):
+        raise ValueError(f"Invalid tenant '{tenant}': use 1-40 lowercase letters, digits, '-' or '_'")
+    return tenant
+
+def collection_name(tenant: str) -> str:
+    """Chroma collection for a tenant; the default tenant keeps the original collection."""
+    return COLLECTION if tenant == DEFAULT_TENANT else f"{COLLECTION}-{tenant}"
+
+def data_dir(tenant: str) -> str:
+    """Directory the tenant's PDFs are ingested from."""
+    return DATA_DIR if tenant == DEFAULT_TENANT else os.path.join(DATA_DIR, tenant)
+
+def db_dir(tenant: str) -> str:
+    """Chroma persistent directory for a tenant; the default tenant keeps store/."""
+    return DB_DIR if tenant == DEFAULT_TENANT else os.path.join(DB_DIR, "tenants", tenant)
+
+def get_client(tenant: str = DEFAULT_TENANT):
+    """
+    Get a ChromaDB client for the tenant's store. Callers close it when done;
+    Chroma shares one system per directory and frees it with the last client.
+    """
+    return chromadb.PersistentClient(path=db_dir(tenant))
+
+class TenantIndex:
+    """A tenant's collection plus a BM25 index over its whole corpus."""
+
+    def __init__(self, tenant: str, collection, client=None):
+        self.tenant = tenant
+        self.collection = collection
+        self.client = client
+        data = collection.get(include=["documents"])
+        self.positions = {id_: i for i, id_ in enumerate(data["ids"])}
+        tokenized = [d.split() for d in data["documents"]]
+        self.bm25 = BM25Okapi(tokenized) if tokenized else None
+        # rough footprint: BM25 keeps a term->count dict per document plus the idf table
+        terms = sum(len(set(t)) for t in tokenized)
+        self.lexical_bytes = (terms + (len(self.bm25.idf) if self.bm25 else 0)) * 100 + len(self.positions) * 150
+        # HNSW keeps every vector (float32) plus up to 2*M neighbour links per node on layer 0
+        sample = collection.get(limit=1, include=["embeddings"])["embeddings"]
+        dim = len(sample[0]) if len(sample) else 0
+        m = (collection.metadata or {}).get("hnsw:M", 16)
+        self.vector_bytes = len(self.positions) * (dim * 4 + m * 2 * 4 + 64)
+
+    def bm25_scores(self, query: str, ids):
+        """BM25 scores for the given chunk ids, or None if any id is unknown to this index."""
+        if self.bm25 is None or any(i not in self.positions for i in ids):
+            return None
+        return self.bm25.get_batch_scores(query.split(), [self.positions[i] for i in ids])
+
+    def close(self):
+        """Release the tenant's Chroma client (and with it the HNSW index in memory)."""
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+
+def _tenant_exists(tenant: str) -> bool:
+    """Whether anything has been ingested for the tenant."""
+    return os.path.isdir(db_dir(tenant))
+
+def _load_index(tenant: str) -> TenantIndex:
+    """Open the tenant's collection from its own store."""
+    client = get_client(tenant)
+    try:
+        col = client.get_collection(collection_name(tenant))
+        return TenantIndex(tenant, col, client)
+    except NotFoundError:
+        client.close()
+        raise UnknownTenant(f"No documents ingested for tenant '{tenant}'")
+    except Exception:
+        client.close()
+        raise
+
+class TenantRegistry:
+    """
+    Lazily loads tenant indexes, evicts idle ones under vector and lexical
+    memory budgets and enforces per-tenant query/ingest concurrency quotas.
+    """
+
+    def __init__(self, vector_budget_mb=VECTOR_MEMORY_BUDGET_MB, lexical_budget_mb=LEXICAL_MEMORY_BUDGET_MB, loader=_load_index, exists=_tenant_exists):
+        self.vector_budget = int(vector_budget_mb * 1024 * 1024)
+        self.lexical_budget = int(lexical_budget_mb * 1024 * 1024)
+        self._loader = loader
+        self._exists = exists
+        self._indexes: "OrderedDict[str, TenantIndex]" = OrderedDict()
+        self._retired: Dict[str, list] = {}
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._slots: Dict[tuple, threading.BoundedSemaphore] = {}
+        self._active: Dict[str, int] = {}
+        self._lock = threading.RLock()
+
+    def get(self, tenant: str) -> TenantIndex:
+        """Return the tenant's index, loading it (and evicting idle ones) if needed."""
+        with self._lock:
+            if tenant in self._indexes:
+                self._indexes.move_to_end(tenant)
+                # an index skipped earlier because it was busy may be idle now
+                self._evict()
+                return self._indexes[tenant]
+        # tenant names come from request headers; keep no state for unknown ones
+        if not self._exists(tenant):
+            raise UnknownTenant(f"No documents ingested for tenant '{tenant}'")
+        with self._lock:
+            load_lock = self._load_locks.setdefault(tenant, threading.Lock())
+        # one loader per tenant; other tenants keep loading/querying meanwhile
+        with load_lock:
+            with self._lock:
+                if tenant in self._indexes:
+                    self._indexes.move_to_end(tenant)
+                    return self._indexes[tenant]
+            index = self._loader(tenant)
+            with self._lock:
+                self._indexes[tenant] = index
+                self._evict()
+            return index
+
+    def _evict(self):
+        """Close least recently used idle indexes until within both budgets."""
+        for tenant in list(self._indexes):
+            if self.vector_used() <= self.vector_budget and self.lexical_used() <= self.lexical_budget:
+                break
+            # never evict the newest index or one a query is running against
+            if tenant == next(reversed(self._indexes)) or self._active.get(tenant):
+                continue
+            self._indexes.pop(tenant).close()
+
+    def vector_used(self) -> int:
+        """Estimated bytes of HNSW index held by loaded tenants."""
+        with self._lock:
+            return sum(i.vector_bytes for i in self._indexes.values())
+
+    def lexical_used(self) -> int:
+        """Estimated bytes of BM25 index held by loaded tenants."""
+        with self._lock:
+            return sum(i.lexical_bytes for i in self._indexes.values())
+
+    def loaded(self):
+        """Tenants currently loaded, least recently used first."""
+        with self._lock:
+            return list(self._indexes)
+
+    def invalidate(self, tenant: str):
+        """Forget a tenant's index so the next query reloads it (e.g. after ingestion)."""
+        with self._lock:
+            index = self._indexes.pop(tenant, None)
+            if index is None:
+                return
+            if self._active.get(tenant):
+                # queries still running against it; close once they finish
+                self._retired.setdefault(tenant, []).append(index)
+            else:
+                index.close()
+
+    @contextmanager
+    def slot(self, tenant: str, kind: str = "query"):
+        """
+        Hold one of the tenant's ``kind`` ("query" or "ingest") slots for the duration.
+
+        Never waits: a tenant over quota gets TenantBusy straight away, so its
+        backlog can't tie up worker threads other tenants need. Query slots
+        exist only for tenants with ingested documents (UnknownTenant
+        otherwise); ingestion callers check for the tenant's PDFs first.
+        """
+        limit = TENANT_QUERY_CONCURRENCY if kind == "query" else TENANT_INGEST_CONCURRENCY
+        if kind == "query" and not self._exists(tenant):
+            raise UnknownTenant(f"No documents ingested for tenant '{tenant}'")
+        with self._lock:
+            sem = self._slots.setdefault((tenant, kind), threading.BoundedSemaphore(limit))
+        if not sem.acquire(blocking=False):
+            raise TenantBusy(f"Tenant '{tenant}' is over its {kind} concurrency quota ({limit})")
+        if kind == "query":
+            with self._lock:
+                self._active[tenant] = self._active.get(tenant, 0) + 1
+        try:
+            yield
+        finally:
+            if kind == "query":
+                with self._lock:
+                    self._active[tenant] -= 1
+                    if not self._active[tenant]:
+                        for index in self._retired.pop(tenant, []):
+                            index.close()
+            sem.release()
+
+registry = TenantRegistry()
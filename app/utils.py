@@ -19,11 +19,28 @@ def normalize(t: str) -> str:
 
 def chunk_text(text: str, chunk_size=800, chunk_overlap=120) -> List[str]:
     """Split text into overlapping chunks based on token count."""
+    return [c["text"] for c in chunk_text_with_spans(text, chunk_size, chunk_overlap)]
+
+def chunk_text_with_spans(text: str, chunk_size=800, chunk_overlap=120) -> List[Dict]:
+    """
+    Split text into overlapping chunks and record where each one lives.
+
+    Returns dicts with the chunk ``text`` plus ``start``/``end`` character
+    offsets into the normalized page text, so overlapping chunks can later
+    be stitched back together without repeating content.
+    """
     tokens = text.split()
+    # character offset of every token in the single-space joined text
+    offsets, pos = [], 0
+    for tok in tokens:
+        offsets.append(pos)
+        pos += len(tok) + 1
+
     chunks, start = [], 0
     while start < len(tokens):
         end = min(start + chunk_size, len(tokens))
         chunk = " ".join(tokens[start:end])
-        chunks.append(chunk)
+        char_start = offsets[start]
+        chunks.append({"text": chunk, "start": char_start, "end": char_start + len(chunk)})
         start = end - chunk_overlap if end - chunk_overlap > start else end
     return chunks 
\ No newline at end of file
@@ -6,6 +6,7 @@ Test script for Mini RAG System
 import os
 import sys
 import tempfile
+from contextlib import ExitStack
 from pathlib import Path
 
 # Add the current directory to Python path
@@ -168,6 +169,316 @@ def test_bm25():
     
     return True
 
+def test_context():
+    """Test context assembly (overlap merging and token budget)."""
+    print("🔄 Testing context assembly...")
+    
+    from app.utils import chunk_text_with_spans
+    from app.context import build_context
+    
+    page = " ".join(f"w{i}" for i in range(30))
+    spans = chunk_text_with_spans(page, chunk_size=10, chunk_overlap=2)
+    if any(page[c["start"]:c["end"]] != c["text"] for c in spans):
+        print("❌ Chunk spans don't match the page text")
+        return False
+    
+    hits = [
+        {"text": c["text"], "score": 0.5 + i / 10,
+         "meta": {"source": "a.pdf", "page": 1, "char_start": c["start"], "char_end": c["end"]}}
+        for i, c in enumerate(spans[:2])
+    ]
+    ctx = build_context(hits, max_tokens=None)
+    if len(ctx["citations"]) != 1 or ctx["tokens"] != 18:
+        print(f"❌ Overlapping chunks were not merged: {ctx['citations']}")
+        return False
+    cit = ctx["citations"][0]
+    if page[cit["start"]:cit["end"]] != " ".join(f"w{i}" for i in range(18)):
+        print(f"❌ Merged citation span is wrong: {cit}")
+        return False
+    
+    # the budget goes to the best-scoring chunk even when it comes later on the page
+    hits[0]["score"], hits[1]["score"] = 0.1, 0.9
+    ctx = build_context(hits, max_tokens=10)
+    cit = ctx["citations"]
+    if ctx["tokens"] != 10 or len(cit) != 1 or cit[0]["score"] != 0.9 or (cit[0]["start"], cit[0]["end"]) != (spans[1]["start"], spans[1]["end"]):
+        print(f"❌ Token budget dropped the top hit: {ctx}")
+        return False
+    
+    # leftover budget picks up the uncovered start of the weaker chunk
+    ctx = build_context(hits, max_tokens=12)
+    cit = ctx["citations"]
+    if ctx["tokens"] != 12 or [c["score"] for c in cit] != [0.9, 0.1] or page[cit[1]["start"]:cit[1]["end"]] != "w0 w1":
+        print(f"❌ Leftover budget not spent in score order: {ctx}")
+        return False
+    
+    print("✅ Context assembly works correctly")
+    return True
+
+def test_generator():
+    """Test the local stand-in generator."""
+    print("🔄 Testing generator...")
+    
+    from app.generate import get_generator
+    
+    gen = get_generator("template")
+    tokens = list(gen.stream("What is RAG?", "[1] (a.pdf p.1 [0:10]) some context"))
+    if len(tokens) < 2 or "".join(tokens) != gen.generate("What is RAG?", "[1] (a.pdf p.1 [0:10]) some context"):
+        print("❌ Streamed tokens don't add up to the full answer")
+        return False
+    
+    print(f"✅ Generator works correctly ({len(tokens)} tokens)")
+    return True
+
+def test_search_params():
+    """Test search preset resolution."""
+    print("🔄 Testing search presets...")
+    
+    from app.query import search_params, SEARCH_PRESETS
+    
+    ef, candidates = search_params(k=25, preset="fast")
+    if candidates < 25 or ef < candidates:
+        print(f"❌ Candidate pool smaller than k (ef={ef}, candidates={candidates})")
+        return False
+    
+    if search_params(k=5, preset="fast", ef=300) != (300, SEARCH_PRESETS["fast"]["candidates"]):
+        print("❌ Explicit ef did not override the preset")
+        return False
+    
+    # end to end: k above the old fixed pool of 10 vector candidates
+    from app import tenants
+    from app.query import hybrid_search, _model
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db_dir, tenants.DB_DIR = tenants.DB_DIR, temp_dir
+        try:
+            client = tenants.get_client("presets-test")
+            col = client.create_collection(tenants.collection_name("presets-test"), metadata={"hnsw:space": "cosine"})
+            docs = [f"document {i} about topic {i % 7} and item {i}" for i in range(40)]
+            col.add(
+                ids=[f"d{i}" for i in range(40)],
+                documents=docs,
+                embeddings=_model().encode(docs, convert_to_numpy=True).tolist(),
+                metadatas=[{"source": "test.pdf", "page": 1} for _ in docs],
+            )
+            client.close()
+            hits = hybrid_search("topic 3", k=15, preset="fast", tenant="presets-test")
+        finally:
+            tenants.registry.invalidate("presets-test")
+            tenants.DB_DIR = db_dir
+    if len(hits) != 15:
+        print(f"❌ hybrid_search(k=15) returned {len(hits)} hits")
+        return False
+    
+    print(f"✅ Search presets work correctly ({', '.join(SEARCH_PRESETS)})")
+    return True
+
+class _FakeCollection:
+    """Just enough of a Chroma collection to build a TenantIndex."""
+    
+    def __init__(self, docs, dim=8):
+        self.docs, self.dim, self.metadata = docs, dim, {"hnsw:M": 16}
+    
+    def get(self, limit=None, include=()):
+        ids = [f"c{i}" for i in range(len(self.docs))][:limit]
+        return {"ids": ids, "documents": self.docs[:limit], "embeddings": [[0.0] * self.dim for _ in ids]}
+
+def test_tenants():
+    """Test tenant naming, index isolation, eviction and concurrency quotas."""
+    print("🔄 Testing tenants...")
+    
+    from app.tenants import TenantRegistry, TenantIndex, TenantBusy, UnknownTenant, validate_tenant, collection_name, TENANT_INGEST_CONCURRENCY
+    
+    if collection_name(validate_tenant(None)) != "docs" or collection_name(validate_tenant("Team-A")) != "docs-team-a":
+        print("❌ Tenant collection names are wrong")
+        return False
+    
+    try:
+        validate_tenant("../etc")
+        print("❌ Invalid tenant name was accepted")
+        return False
+    except ValueError:
+        pass
+    
+    corpora = {
+        "team-a": ["refund policy for returns", "shipping times"],
+        "team-b": ["device reset steps", "warranty period", "reset the router"],
+    }
+    closed = []
+    class Index(TenantIndex):
+        def close(self):
+            closed.append(self.tenant)
+    loads = []
+    def loader(tenant):
+        loads.append(tenant)
+        return Index(tenant, _FakeCollection(corpora[tenant]))
+    
+    exists = corpora.__contains__
+    
+    # per-tenant isolation: each index only knows its own corpus
+    registry = TenantRegistry(loader=loader, exists=exists)
+    a, b = registry.get("team-a"), registry.get("team-b")
+    if len(a.positions) != 2 or len(b.positions) != 3 or registry.get("team-a") is not a or loads != ["team-a", "team-b"]:
+        print("❌ Tenant indexes are not isolated or not cached")
+        return False
+    if a.bm25_scores("reset", ["c0", "c1"]) is None or a.bm25_scores("reset", ["c0", "c2"]) is not None:
+        print("❌ Stale-index fallback (unknown id -> None) not honoured")
+        return False
+    
+    # LRU eviction: with room for one index, loading another closes the idle one
+    registry = TenantRegistry(lexical_budget_mb=(a.lexical_bytes + 1) / (1024 * 1024), loader=loader, exists=exists)
+    registry.get("team-a")
+    registry.get("team-b")
+    if registry.loaded() != ["team-b"] or closed != ["team-a"]:
+        print(f"❌ LRU eviction failed: loaded={registry.loaded()} closed={closed}")
+        return False
+    
+    # ...but an index with a running query is never evicted
+    with registry.slot("team-b"):
+        registry.get("team-a")
+        if registry.loaded() != ["team-b", "team-a"]:
+            print(f"❌ Evicted an index in use: {registry.loaded()}")
+            return False
+    
+    # unknown tenant names (they come from request headers) leave no state behind
+    registry = TenantRegistry(loader=loader, exists=exists)
+    for name in ("team-x", "team-y"):
+        try:
+            registry.get(name)
+        except UnknownTenant:
+            pass
+        try:
+            with registry.slot(name):
+                pass
+        except UnknownTenant:
+            pass
+    if registry._load_locks or registry._slots or "team-x" in loads:
+        print(f"❌ Unknown tenants left state behind: {registry._load_locks} {registry._slots}")
+        return False
+    
+    with registry.slot("team-a", "ingest"):
+        try:
+            with registry.slot("team-a", "ingest"):
+                print(f"❌ Ingest quota ({TENANT_INGEST_CONCURRENCY}) not enforced")
+                return False
+        except TenantBusy:
+            pass
+        with registry.slot("team-b", "ingest"):
+            pass
+    
+    print("✅ Tenants work correctly")
+    return True
+
+def _sse_events(body: str):
+    """Parse an SSE body into (event, data) pairs, skipping comments."""
+    import json
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":"))
+        if "event" in fields:
+            events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+def test_stream():
+    """Test the /ask/stream event order and its error path."""
+    print("🔄 Testing streaming endpoint...")
+    
+    from fastapi.testclient import TestClient
+    from app import api, tenants
+    
+    hits = [{"id": "a.pdf::p1::c0", "text": "w0 w1 w2 w3", "score": 0.9,
+             "meta": {"source": "a.pdf", "page": 1, "char_start": 0, "char_end": 11}}]
+    client = TestClient(api.app)
+    search = api.hybrid_search
+    
+    def fail(q, **kwargs):
+        raise RuntimeError("index unavailable")
+    
+    # an existing (empty) default store; the search itself is replaced
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db_dir, tenants.DB_DIR = tenants.DB_DIR, temp_dir
+        try:
+            api.hybrid_search = lambda q, **kwargs: hits
+            body = client.get("/ask/stream", params={"q": "what?"}).text
+            api.hybrid_search = fail
+            failed = client.get("/ask/stream", params={"q": "what?"}).text
+        finally:
+            api.hybrid_search = search
+            tenants.DB_DIR = db_dir
+    
+    events = _sse_events(body)
+    names = [e for e, _ in events]
+    if names[0] != "citations" or names[-1] != "done" or set(names[1:-1]) != {"token"}:
+        print(f"❌ Wrong event order: {names}")
+        return False
+    done = events[-1][1]
+    if done["tokens"] != len(names) - 2 or not done["ttfb_ms"] or not done["tokens_per_s"]:
+        print(f"❌ Incomplete metrics: {done}")
+        return False
+    
+    # failures after the stream has started arrive as an error event
+    events = _sse_events(failed)
+    if events != [("error", {"status": 500, "detail": "Internal server error"})]:
+        print(f"❌ Search failure not reported as an error event: {events}")
+        return False
+    
+    print(f"✅ Streaming endpoint works correctly ({len(names)} events)")
+    return True
+
+def test_tenant_api():
+    """Test tenant selection, unknown tenants and quotas through the API."""
+    print("🔄 Testing tenant API...")
+    
+    from fastapi.testclient import TestClient
+    from app import api, tenants
+    from app.query import _model
+    
+    client = TestClient(api.app)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db_dir, tenants.DB_DIR = tenants.DB_DIR, temp_dir
+        try:
+            for name in ("team-a", "team-b"):
+                store = tenants.get_client(name)
+                col = store.create_collection(tenants.collection_name(name), metadata={"hnsw:space": "cosine"})
+                docs = [f"{name} handbook section {i}" for i in range(3)]
+                col.add(
+                    ids=[f"{name}-{i}" for i in range(3)],
+                    documents=docs,
+                    embeddings=_model().encode(docs, convert_to_numpy=True).tolist(),
+                    metadatas=[{"source": f"{name}.pdf", "page": 1} for _ in docs],
+                )
+                store.close()
+            
+            def sources(**kwargs):
+                r = client.get("/search", params={"q": "handbook", **kwargs.pop("params", {})}, **kwargs)
+                return r.status_code, {h["source"] for h in r.json()} if r.status_code == 200 else None
+            
+            # ?tenant= overrides the X-Tenant header
+            by_header = sources(headers={"X-Tenant": "team-a"})
+            by_param = sources(headers={"X-Tenant": "team-a"}, params={"tenant": "team-b"})
+            if by_header != (200, {"team-a.pdf"}) or by_param != (200, {"team-b.pdf"}):
+                print(f"❌ Wrong tenant selected: header={by_header} param={by_param}")
+                return False
+            
+            if sources(headers={"X-Tenant": "team-z"})[0] != 404 or client.get("/ask/stream", params={"q": "x", "tenant": "team-z"}).status_code != 404:
+                print("❌ Unknown tenant did not get 404")
+                return False
+            
+            # a tenant at its quota is rejected at once; other tenants are unaffected
+            with ExitStack() as held:
+                for _ in range(tenants.TENANT_QUERY_CONCURRENCY):
+                    held.enter_context(tenants.registry.slot("team-a"))
+                busy, other = sources(params={"tenant": "team-a"})[0], sources(params={"tenant": "team-b"})[0]
+            if busy != 429 or other != 200:
+                print(f"❌ Quota not enforced per tenant: team-a={busy} team-b={other}")
+                return False
+        finally:
+            for name in ("team-a", "team-b"):
+                tenants.registry.invalidate(name)
+            tenants.DB_DIR = db_dir
+    
+    print("✅ Tenant API works correctly")
+    return True
+
 def main():
     """Run all tests."""
     print("🧪 Testing Mini RAG System Components...")
@@ -179,6 +490,12 @@ def main():
         ("Embedding Model", test_embedding_model),
         ("ChromaDB", test_chromadb),
         ("BM25", test_bm25),
+        ("Context Assembly", test_context),
+        ("Generator", test_generator),
+        ("Streaming", test_stream),
+        ("Search Presets", test_search_params),
+        ("Tenants", test_tenants),
+        ("Tenant API", test_tenant_api),
     ]
     
     passed = 0